@@ -1,25 +1,39 @@
 from .utils import BlockHash
 from .transaction import Transaction
-from typing import List
+from typing import List, Optional
 import hashlib
 
 class Block:
+    __slots__ = ('prev_block_hash', 'transactions', '_hash')
+
     # implement __init__ as you see fit.
 
     def __init__(self, prev_block_hash: BlockHash, transactions: List[Transaction]) -> None:
         #args is either (List[transactions],prev_block_hash) or (List[transactions]), for initial block
         self.transactions: List[Transaction] = transactions
         self.prev_block_hash: BlockHash = prev_block_hash
+        # the digest is computed once and cached. Blocks received from other nodes are checked with matches_hash,
+        # since their contents may have been changed after the hash was cached.
+        self._hash: Optional[BlockHash] = None
 
 
     def get_block_hash(self) -> BlockHash:
         """returns hash of this block"""
-        h = hashlib.sha256()
-        h.update(self.prev_block_hash)
-        for transaction in self.transactions:
-            transaction.get_txid()
-            h.update(transaction.get_txid())
-        return BlockHash(h.digest())
+        if self._hash is not None:
+            return self._hash
+        # hash the whole block in a single call instead of updating once per transaction
+        self._hash = BlockHash(hashlib.sha256(self.prev_block_hash + b"".join(
+            transaction.get_txid() for transaction in self.transactions)).digest())
+        return self._hash
+
+    def matches_hash(self, block_hash: BlockHash) -> bool:
+        """Checks that this block hashes to block_hash when the hash is recomputed from the current contents,
+        and that the cached hashes of the block and of its transactions agree with the recomputed ones."""
+        txids = [transaction.compute_txid() for transaction in self.transactions]
+        if any(transaction.get_txid() != txid for transaction, txid in zip(self.transactions, txids)):
+            return False
+        recomputed = BlockHash(hashlib.sha256(self.prev_block_hash + b"".join(txids)).digest())
+        return recomputed == block_hash and self.get_block_hash() == block_hash
 
 
     def get_transactions(self) -> List[Transaction]:
@@ -2,6 +2,7 @@ from .utils import *
 from .block import Block
 from .transaction import Transaction
 from typing import Set, Optional, List, Dict
+from collections import ChainMap, OrderedDict
 import secrets
 
 class Node:
@@ -12,13 +13,25 @@ class Node:
         keytuple = gen_keys()
         self.privatekey: PrivateKey = keytuple[0]
         self.publickey: PublicKey = keytuple[1]
-        self.balance: List[TxID] = []
+        # the coins this node owns, as an insertion-ordered dict, so the oldest coin is spent first on every run
+        self.balance: Dict[TxID,None] = {}
         self.latest_hash: BlockHash = GENESIS_BLOCK_PREV
         self.blockchain: List[Block] = []
-        self.mempool: List[Transaction] = []
-        self.utxo: List[Transaction] = []
-        self.connections: Set[Node] = set([])
+        # the mempool is keyed by the coin each transaction spends, the utxo by the txid of the unspent transaction
+        self.mempool: Dict[TxID,Transaction] = {}
+        self.utxo: Dict[TxID,Transaction] = {}
+        # connections are kept in a list for a stable gossip order, and their ids in a set for O(1) membership tests
+        self.connections: List[Node] = []
+        self._connection_ids: Set[int] = set()
         self.txid_to_transaction: Dict[TxID,Transaction] = {}
+        # txids of all the transactions on the current chain, spent or not
+        self.chain_txids: Set[TxID] = set()
+        self.block_by_hash: Dict[BlockHash,Block] = {}
+        # maps every hash on the chain to the number of blocks up to and including it (0 for the genesis marker)
+        self.hash_to_index: Dict[BlockHash,int] = {GENESIS_BLOCK_PREV: 0}
+        # the most recent txids that went through this node's mempool, so gossip is not processed twice.
+        # Bounded by SEEN_TXIDS_SIZE - a forgotten txid is still caught by the mempool check.
+        self.seen_txids: OrderedDict[TxID,None] = OrderedDict()
 
 
     def connect(self, other: 'Node') -> None:
@@ -27,23 +40,29 @@ class Node:
         Raises an exception if asked to connect to itself.
         The connection itself does not trigger updates about the mempool,
         but nodes instantly notify of their latest block to each other (see notify_of_block)"""
-        if other.get_address() == self.get_address():
+        if other is self or other.get_address() == self.get_address():
             raise ValueError()
-        self.connections.add(other)
-        other.connections.add(self)
+        if id(other) in self._connection_ids:
+            return
+        self.connections.append(other)
+        self._connection_ids.add(id(other))
+        other.connections.append(self)
+        other._connection_ids.add(id(self))
 
         self.notify_of_block(other.get_latest_hash(), other)
         other.notify_of_block(self.get_latest_hash(), self)
 
     def disconnect_from(self, other: 'Node') -> None:
         """Disconnects this node from the other node. If the two were not connected, then nothing happens"""
-        if other in self.connections:
+        if id(other) in self._connection_ids:
             self.connections.remove(other)
+            self._connection_ids.remove(id(other))
             other.connections.remove(self)
+            other._connection_ids.remove(id(self))
 
     def get_connections(self) -> Set['Node']:
         """Returns a set containing the connections of this node."""
-        return self.connections
+        return set(self.connections)
 
     def add_transaction_to_mempool(self, transaction: Transaction) -> bool:
         """
@@ -56,32 +75,34 @@ class Node:
         If the transaction is added successfully, then it is also sent to neighboring nodes.
         """
 
-        if transaction.input in [t.input for t in self.get_mempool()]:
+        txid = transaction.get_txid()
+        if txid in self.seen_txids:
+            return False
+        if transaction.input in self.mempool:
             return False
 
-        source_address = None
-        trans_exists = False
-
-        # This also takes care of coinbase transactions not being allowed into mempool - otherwise trans_exists will be false
-        for t in self.get_utxo():
-            if t.get_txid() == transaction.input:
-                source_address = t.output
-                trans_exists = True
-                break
-
-        if not trans_exists:
+        # This also takes care of coinbase transactions not being allowed into mempool - their input is None
+        source = self.utxo.get(transaction.input)
+        if source is None:
             return False
 
-        if not verify(transaction.output+transaction.input, transaction.signature, source_address):
+        if not verify_cached(transaction.output+transaction.input, transaction.signature, source.output):
             return False
 
-        self.mempool.append(transaction)
-        for node in self.get_connections():
-            if transaction not in node.get_mempool():
+        self.mempool[transaction.input] = transaction
+        self._mark_seen(txid)
+        for node in self.connections:
+            if txid not in node.seen_txids:
                 node.add_transaction_to_mempool(transaction)
-        self.txid_to_transaction[transaction.get_txid()] = transaction
+        self.txid_to_transaction[txid] = transaction
         return True
 
+    def _mark_seen(self, txid: TxID) -> None:
+        """Remembers the given txid, forgetting the oldest one once SEEN_TXIDS_SIZE txids are remembered"""
+        self.seen_txids[txid] = None
+        if len(self.seen_txids) > SEEN_TXIDS_SIZE:
+            self.seen_txids.popitem(last=False)
+
     def notify_of_block(self, block_hash: BlockHash, sender: 'Node') -> None:
         """This method is used by a node's connection to inform it that it has learned of a
         new block (or created a new block). If the block is unknown to the current Node, The block is requested.
@@ -102,78 +123,134 @@ class Node:
         not conflict.
         """
 
-        hashes = [block.get_block_hash() for block in self.blockchain]
-        hashes.insert(0,GENESIS_BLOCK_PREV)
-
-        if block_hash in hashes:
-            return
-        try:
-            current_block = sender.get_block(block_hash)
-            if current_block.get_block_hash() != block_hash:
-                return
-
-        except ValueError:
+        if block_hash in self.hash_to_index:
             return
         blocks_to_read = []
+        # walk back until reaching a known hash. GENESIS_BLOCK_PREV is always known, so the walk ends there at the latest.
         # problem: what if initial hash of attacker not genesis block? answer: will catch the valueerror
-        while current_block.get_prev_block_hash() not in hashes:
-            blocks_to_read.append(current_block)
+        current_hash = block_hash
+        while current_hash not in self.hash_to_index:
             try:
-                a = sender.get_block(current_block.get_prev_block_hash())
-                if a.get_block_hash() != current_block.get_prev_block_hash():
-                    break
-                current_block = a
+                current_block = sender.get_block(current_hash)
             except ValueError:
                 return
-        blocks_to_read.append(current_block)
+            # recomputed from the raw contents: the sender may have changed the block after its hash was cached
+            if not current_block.matches_hash(current_hash):
+                return
+            blocks_to_read.append(current_block)
+            current_hash = current_block.get_prev_block_hash()
         blocks_to_read.reverse()
         # First, roll back utxo and mempool
 
-        trial_utxo: List[Transaction] = []
-        trial_txid_to_transaction: dict[TxID,Transaction] = self.txid_to_transaction
-        trial_blockchain: List[Block] = []
-        for block in self.blockchain[:hashes.index(current_block.get_prev_block_hash())]:
-            trial_blockchain.append(block)
-            for transaction in block.get_transactions():
+        trial_utxo: Dict[TxID,Transaction] = dict(self.utxo)
+        trial_balance: Dict[TxID,None] = dict(self.balance)
+        # new transactions are written to trial_additions and only merged into txid_to_transaction if the chain is adopted
+        trial_additions: Dict[TxID,Transaction] = {}
+        trial_chain_txids: Set[TxID] = set(self.chain_txids)
+        fork_index = self.hash_to_index[current_hash]
+        trial_blockchain: List[Block] = self.blockchain[:fork_index]
+        # undo only the blocks past the split point, newest first
+        for block in reversed(self.blockchain[fork_index:]):
+            for transaction in reversed(block.get_transactions()):
+                del trial_utxo[transaction.get_txid()]
+                trial_chain_txids.discard(transaction.get_txid())
+                trial_balance.pop(transaction.get_txid(), None)
                 if transaction.input is not None:
-                    trial_utxo.remove(self.txid_to_transaction[transaction.input])
-                trial_utxo.append(transaction)
-                trial_txid_to_transaction[transaction.get_txid()] = transaction
-
+                    source = self.txid_to_transaction[transaction.input]
+                    trial_utxo[transaction.input] = source
+                    if source.output == self.publickey:
+                        trial_balance[transaction.input] = None
+
+        # Signatures do not depend on the utxo. When the new blocks carry enough signatures to be verified on worker
+        # processes (see PARALLEL_VERIFY), all of them are checked together before the blocks are applied one by one.
+        # Otherwise each block is checked inside the loop below, which stops at the first invalid block.
+        # Transactions whose source is unknown are skipped here - the utxo check below rejects their block.
+        good_sigs: Optional[Dict[BlockHash,bool]] = None
+        signature_count = sum(t.input is not None for block in blocks_to_read
+                              if len(block.get_transactions()) <= BLOCK_SIZE for t in block.get_transactions())
+        if verifies_in_parallel(signature_count):
+            new_transactions: Dict[TxID,Transaction] = {t.get_txid(): t for block in blocks_to_read
+                                                        for t in block.get_transactions()}
+            sources: ChainMap[TxID,Transaction] = ChainMap(new_transactions, self.txid_to_transaction)
+            messages, signatures, public_keys, signed_in = [], [], [], []
+            for block in blocks_to_read:
+                if len(block.get_transactions()) > BLOCK_SIZE:
+                    continue
+                for t in block.get_transactions():
+                    if t.input is not None and t.input in sources:
+                        messages.append(t.output+t.input)
+                        signatures.append(t.signature)
+                        public_keys.append(sources[t.input].output)
+                        signed_in.append(block.get_block_hash())
+            good_sigs = {block.get_block_hash(): True for block in blocks_to_read}
+            for signed_block_hash, good in zip(signed_in, verify_many(messages, signatures, public_keys)):
+                if not good:
+                    good_sigs[signed_block_hash] = False
 
         # We will stop counting blocks in new blockchain when we hit an illegal block
 
-        good_sig = lambda transaction, source_address: verify(transaction.output+transaction.input, transaction.signature, source_address)
-        in_trial_utxo = lambda  transaction: trial_txid_to_transaction[transaction.input] in trial_utxo
+        in_trial_utxo = lambda  transaction: transaction.input in trial_utxo
         for block in blocks_to_read:
             if len(block.get_transactions()) > BLOCK_SIZE:
                 break
-            if len([t for t in block.get_transactions() if t.input is None]) != 1:
+            non_coinbase_tx, coinbase_count = [], 0
+            for t in block.get_transactions():
+                if t.input is None:
+                    coinbase_count += 1
+                else:
+                    non_coinbase_tx.append(t)
+            if coinbase_count != 1:
                 break
-            non_coinbase_tx = list(filter(lambda transaction: transaction.input is not None, block.get_transactions()))
-            public_keys = [trial_txid_to_transaction[t.input].output for t in non_coinbase_tx]
-            if not all(list(map(good_sig, non_coinbase_tx, public_keys))):
+            # two transactions spending the same coin
+            if len({t.input for t in non_coinbase_tx}) != len(non_coinbase_tx):
                 break
-            if not all(list(map(in_trial_utxo, non_coinbase_tx))):
+            if not all(map(in_trial_utxo, non_coinbase_tx)):
                 break
+            # a copy of a transaction already on the chain (e.g. a replayed coinbase) would share its txid,
+            # so the utxo would hold it once while undoing the chain would remove it twice
+            if any(t.get_txid() in trial_chain_txids for t in block.get_transactions()):
+                break
+            if good_sigs is not None:
+                if not good_sigs[block.get_block_hash()]:
+                    break
+            else:
+                messages = [t.output+t.input for t in non_coinbase_tx]
+                signatures = [t.signature for t in non_coinbase_tx]
+                public_keys = [trial_utxo[t.input].output for t in non_coinbase_tx]
+                if not verify_batch(messages, signatures, public_keys):
+                    break
 
             trial_blockchain.append(block)
             for transaction in block.get_transactions():
                 if transaction.input is not None:
-                    trial_utxo.remove(trial_txid_to_transaction[transaction.input])
-                trial_utxo.append(transaction)
-                trial_txid_to_transaction[transaction.get_txid()] = transaction
+                    del trial_utxo[transaction.input]
+                    trial_balance.pop(transaction.input, None)
+                trial_utxo[transaction.get_txid()] = transaction
+                trial_additions[transaction.get_txid()] = transaction
+                trial_chain_txids.add(transaction.get_txid())
+                if transaction.output == self.publickey:
+                    trial_balance[transaction.get_txid()] = None
 
         if len(trial_blockchain) > len(self.blockchain):
+            # only the blocks past the split point change, so patch the index instead of rebuilding it
+            for block in self.blockchain[fork_index:]:
+                del self.block_by_hash[block.get_block_hash()]
+                del self.hash_to_index[block.get_block_hash()]
+            for index, block in enumerate(trial_blockchain[fork_index:], fork_index+1):
+                self.block_by_hash[block.get_block_hash()] = block
+                self.hash_to_index[block.get_block_hash()] = index
             self.blockchain = trial_blockchain
-            self.txid_to_transaction = trial_txid_to_transaction
-            self.mempool = list(filter(lambda transaction: trial_txid_to_transaction[transaction.input] in trial_utxo, self.mempool))
+            self.txid_to_transaction.update(trial_additions)
+            self.mempool = {coin: transaction for coin, transaction in self.mempool.items() if coin in trial_utxo}
+            # transactions that were rolled back may be gossiped again
+            self.seen_txids = OrderedDict.fromkeys([t.get_txid() for t in self.mempool.values()][-SEEN_TXIDS_SIZE:])
             self.utxo = trial_utxo
+            self.chain_txids = trial_chain_txids
 
             self.latest_hash = self.blockchain[-1].get_block_hash()
-            self.balance = [t.get_txid() for t in trial_utxo if t.output == self.publickey]
+            self.balance = trial_balance
             for node in self.connections:
-                node.notify_of_block(block_hash, self)
+                node.notify_of_block(self.latest_hash, self)
 
 
     def mine_block(self) -> BlockHash:
@@ -186,36 +263,41 @@ class Node:
         If a new block is created, all connections of this node are notified by calling their notify_of_block() method.
         The method returns the new block hash (or None if there was no block)
         """
-        transactions = self.mempool[:BLOCK_SIZE-1]
-        self.mempool = self.mempool[BLOCK_SIZE-1:]
-        self.balance = [tx for tx in self.balance if tx not in [t.input for t in transactions]]
+        transactions = list(self.mempool.values())[:BLOCK_SIZE-1]
+        for t in transactions:
+            del self.mempool[t.input]
+            self.balance.pop(t.input, None)
         fake_sig = Signature(secrets.token_bytes(48))
         coinbase_transaction = Transaction(self.get_address(), None, fake_sig)
         transactions.append(coinbase_transaction)
         new_block = Block(self.get_latest_hash(), transactions)
         for t in transactions:
             if t.input is not None:
-                self.utxo.remove(self.txid_to_transaction[t.input])
-            self.utxo.append(t)
+                del self.utxo[t.input]
+            self.utxo[t.get_txid()] = t
             self.txid_to_transaction[t.get_txid()] = t
+            self.chain_txids.add(t.get_txid())
             if t.output == self.get_address():
-                self.balance.append(t.get_txid())
+                self.balance[t.get_txid()] = None
+        new_block_hash = new_block.get_block_hash()
         self.blockchain.append(new_block)
-        self.latest_hash = new_block.get_block_hash()
+        self.latest_hash = new_block_hash
+        self.block_by_hash[new_block_hash] = new_block
+        self.hash_to_index[new_block_hash] = len(self.blockchain)
 
         for node in self.connections:
-            node.notify_of_block(new_block.get_block_hash(), self)
-        return new_block.get_block_hash()
+            node.notify_of_block(new_block_hash, self)
+        return new_block_hash
 
     def get_block(self, block_hash: BlockHash) -> Block:
         """
         This function returns a block object given its hash.
         If the block doesnt exist, a ValueError is raised.
         """
-        for block in self.blockchain:
-            if block.get_block_hash() == block_hash:
-                return block
-        raise ValueError()
+        try:
+            return self.block_by_hash[block_hash]
+        except KeyError:
+            raise ValueError()
 
     def get_latest_hash(self) -> BlockHash:
         """
@@ -227,13 +309,13 @@ class Node:
         """
         This function returns the list of transactions that didn't enter any block yet.
         """
-        return self.mempool
+        return list(self.mempool.values())
 
     def get_utxo(self) -> List[Transaction]:
         """
         This function returns the list of unspent transactions.
         """
-        return self.utxo
+        return list(self.utxo.values())
 
     # ------------ Formerly wallet methods: -----------------------
 
@@ -248,8 +330,7 @@ class Node:
 
         The transaction is added to the mempool (and as a result is also published to neighboring nodes)
         """
-        txid_in_mempool = [t.input for t in self.mempool]
-        available_coins = [coin for coin in self.balance if coin not in txid_in_mempool]
+        available_coins = [coin for coin in self.balance if coin not in self.mempool]
         if not available_coins:
             return None
         new_transaction = Transaction(target, available_coins[0], sign(target+available_coins[0], self.privatekey))
@@ -261,7 +342,8 @@ class Node:
         """
         Clears the mempool of this node. All transactions waiting to be entered into the next block are gone.
         """
-        self.mempool = []
+        self.mempool = {}
+        self.seen_txids = OrderedDict()
 
     def get_balance(self) -> int:
         """
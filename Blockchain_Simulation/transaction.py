@@ -4,6 +4,7 @@ import hashlib
 class Transaction:
     """Represents a transaction that moves a single coin
     A transaction with no source creates money. It will only be created by the node that mined the block."""
+    __slots__ = ('output', 'input', 'signature', '_txid')
 
     def __init__(self, output: PublicKey, input: Optional[TxID], signature: Signature) -> None:
         # do not change the name of this field:
@@ -12,9 +13,18 @@ class Transaction:
         self.input: Optional[TxID] = input
         # do not change the name of this field:
         self.signature: Signature = signature
+        # the txid is computed once and cached. Transactions received from other nodes are checked against
+        # compute_txid, since their fields may have been changed after the txid was cached.
+        self._txid: Optional[TxID] = None
 
     def get_txid(self) -> TxID:
         """Returns the identifier of this transaction. This is the SHA256 of the transaction contents."""
+        if self._txid is None:
+            self._txid = self.compute_txid()
+        return self._txid
+
+    def compute_txid(self) -> TxID:
+        """Computes the txid from the current contents of this transaction, ignoring the cached value."""
         if self.input is not None:
             return TxID(hashlib.sha256(self.output+self.input+self.signature).digest())
         return TxID(hashlib.sha256(self.output+self.signature).digest())
@@ -1,6 +1,11 @@
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
-from typing import NewType, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NewType, Tuple, Sequence, Optional, List
+from functools import lru_cache
+import atexit
+import os
 
 # The following types are used to distinguish between bytes that are used as private keys, public keys and signature.
 # This utilizes typechecking to ensure we won't be using them interchangeably.
@@ -17,6 +22,22 @@ TxID = NewType("TxID", bytes)  # this will be a hash of a transaction
 GENESIS_BLOCK_PREV = BlockHash(b"Genesis")
 # The maximal size of a block. Larger blocks are illegal. Do not change this value.
 BLOCK_SIZE = 10
+# The number of (message, signature, public key) verification results remembered by verify_cached.
+SIG_CACHE_SIZE = 4096
+# The number of recent txids each node remembers to avoid processing gossip twice.
+SEEN_TXIDS_SIZE = 10 * BLOCK_SIZE
+# The number of deserialized public keys kept around by verify.
+KEY_CACHE_SIZE = 1024
+# Set to True to verify large batches of signatures on worker processes. Off by default: with the "spawn" and
+# "forkserver" start methods every worker re-imports the main script, so the script must be guarded by
+# if __name__ == "__main__". Ignored on machines with a single CPU.
+PARALLEL_VERIFY = False
+# Batches with fewer signatures than this are verified in this process: handing a few signatures to worker
+# processes costs more than checking them directly.
+PARALLEL_VERIFY_THRESHOLD = 256
+
+# created on first use, so importing this module does not start any processes
+_verify_pool: Optional[ProcessPoolExecutor] = None
 
 
 def sign(message: bytes, private_key: PrivateKey) -> Signature:
@@ -26,11 +47,16 @@ def sign(message: bytes, private_key: PrivateKey) -> Signature:
     return Signature(pk.sign(message))
 
 
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _load_public_key(pub_key: PublicKey) -> Ed25519PublicKey:
+    """Deserializes a public key. Nodes verify many signatures by the same few keys, so loaded keys are reused"""
+    return Ed25519PublicKey.from_public_bytes(pub_key)
+
+
 def verify(message: bytes, sig: Signature, pub_key: PublicKey) -> bool:
     """Verifies a signature for a given message using a public key. 
     Returns True is the signature matches, otherwise False"""
-    pub_k = Ed25519PublicKey.from_public_bytes(
-        pub_key)
+    pub_k = _load_public_key(pub_key)
     try:
         pub_k.verify(sig, message)
         return True
@@ -38,6 +64,66 @@ def verify(message: bytes, sig: Signature, pub_key: PublicKey) -> bool:
         return False
 
 
+@lru_cache(maxsize=SIG_CACHE_SIZE)
+def verify_cached(message: bytes, sig: Signature, pub_key: PublicKey) -> bool:
+    """Same as verify, but remembers recent results, so a transaction seen by many nodes is only checked once"""
+    return verify(message, sig, pub_key)
+
+
+def _verify_one(args: Tuple[bytes, Signature, PublicKey]) -> bool:
+    """verify for a single (message, signature, public key) tuple. Defined at module level so it can be pickled"""
+    return verify(*args)
+
+
+def _shutdown_verify_pool() -> None:
+    global _verify_pool
+    if _verify_pool is not None:
+        _verify_pool.shutdown(wait=False, cancel_futures=True)
+        _verify_pool = None
+
+
+atexit.register(_shutdown_verify_pool)
+
+
+def verifies_in_parallel(count: int) -> bool:
+    """Returns True if a batch of count signatures would be verified on worker processes"""
+    return PARALLEL_VERIFY and count >= PARALLEL_VERIFY_THRESHOLD and (os.cpu_count() or 1) > 1
+
+
+def _verify_on_pool(messages: Sequence[bytes], sigs: Sequence[Signature],
+                    pub_keys: Sequence[PublicKey]) -> Optional[List[bool]]:
+    """Verifies the batch on worker processes and returns the result of each signature.
+    Returns None if the batch should be verified in this process instead: parallel verification is off, the batch is
+    too small, there is a single CPU, or the pool broke (in which case it is discarded)."""
+    global _verify_pool
+    if not verifies_in_parallel(len(messages)):
+        return None
+    workers = os.cpu_count() or 1
+    if _verify_pool is None:
+        _verify_pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        return list(_verify_pool.map(_verify_one, zip(messages, sigs, pub_keys),
+                                     chunksize=max(1, len(messages) // workers)))
+    except BrokenProcessPool:
+        _shutdown_verify_pool()
+        return None
+
+
+def verify_batch(messages: Sequence[bytes], sigs: Sequence[Signature], pub_keys: Sequence[PublicKey]) -> bool:
+    """Verifies a batch of signatures, where sigs[i] should be the signature of messages[i] by pub_keys[i].
+    Returns True iff all of the signatures match. Stops at the first signature that fails."""
+    return all(map(verify_cached, messages, sigs, pub_keys))
+
+
+def verify_many(messages: Sequence[bytes], sigs: Sequence[Signature], pub_keys: Sequence[PublicKey]) -> List[bool]:
+    """Verifies every signature, where sigs[i] should be the signature of messages[i] by pub_keys[i],
+    and returns the result of each one. Large batches are split between worker processes (see PARALLEL_VERIFY)."""
+    results = _verify_on_pool(messages, sigs, pub_keys)
+    if results is not None:
+        return results
+    return list(map(verify_cached, messages, sigs, pub_keys))
+
+
 def gen_keys() -> Tuple[PrivateKey, PublicKey]:
     """generates a private key and a corresponding public key. 
     The keys are returned in byte format to allow them to be serialized easily."""
@@ -0,0 +1,66 @@
+import unittest
+
+from Blockchain_Simulation import *
+
+
+class TestReceivedBlocks(unittest.TestCase):
+    def test_block_changed_after_hashing_is_rejected(self) -> None:
+        evil, victim = Node(), Node()
+        evil.mine_block()
+        block = evil.get_block(evil.get_latest_hash())
+        # the block hash is already cached. Swap the coinbase for one paying someone else.
+        block.get_transactions()[-1] = Transaction(Node().get_address(), None, Signature(b"x" * 48))
+        victim.connect(evil)
+        self.assertEqual(victim.get_latest_hash(), GENESIS_BLOCK_PREV)
+        self.assertEqual(victim.get_utxo(), [])
+
+    def test_transaction_changed_after_hashing_is_rejected(self) -> None:
+        evil, victim = Node(), Node()
+        evil.mine_block()
+        coinbase = evil.get_block(evil.get_latest_hash()).get_transactions()[-1]
+        coinbase.output = Node().get_address()
+        victim.connect(evil)
+        self.assertEqual(victim.get_latest_hash(), GENESIS_BLOCK_PREV)
+
+    def test_block_replaying_a_coinbase_is_rejected(self) -> None:
+        evil, victim, honest = Node(), Node(), Node()
+        evil.mine_block()
+        first = evil.get_block(evil.get_latest_hash())
+        coinbase = first.get_transactions()[-1]
+        replay = Block(first.get_block_hash(), [Transaction(coinbase.output, None, coinbase.signature)])
+        victim.notify_of_block(replay.get_block_hash(), _BlockSource(first, replay))
+        self.assertEqual(victim.get_latest_hash(), first.get_block_hash())
+        self.assertEqual(len(victim.get_utxo()), 1)
+
+        # a longer chain undoes the accepted block without losing track of the utxo
+        for _ in range(3):
+            honest.mine_block()
+        victim.connect(honest)
+        self.assertEqual(victim.get_latest_hash(), honest.get_latest_hash())
+        self.assertEqual(len(victim.get_utxo()), 3)
+
+
+class _BlockSource:
+    """Serves the given blocks by hash, like a node whose chain was assembled by hand"""
+
+    def __init__(self, *blocks: Block) -> None:
+        self.blocks = {block.get_block_hash(): block for block in blocks}
+
+    def get_block(self, block_hash: BlockHash) -> Block:
+        if block_hash not in self.blocks:
+            raise ValueError()
+        return self.blocks[block_hash]
+
+
+class TestWallet(unittest.TestCase):
+    def test_oldest_coin_is_spent_first(self) -> None:
+        miner, target = Node(), Node()
+        first_block = miner.get_block(miner.mine_block())
+        for _ in range(3):
+            miner.mine_block()
+        transaction = miner.create_transaction(target.get_address())
+        self.assertEqual(transaction.input, first_block.get_transactions()[-1].get_txid())
+
+
+if __name__ == "__main__":
+    unittest.main()